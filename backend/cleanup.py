@@ -1,14 +1,30 @@
 import asyncio
-import pathlib
+import heapq
+import os
+import re
 import shutil
 import time
 import logging
-from typing import Dict, Any
+from typing import Dict, List, Set, Tuple
+
+from .models import Task
+from .download_worker import EXPIRIES, EXPIRIES_LOCK, TASK_TTL, TASKS_LOCK, TMP_ROOT
 
 logger = logging.getLogger(__name__)
 
+# Task directories are named after uuid4 task ids
+_UUID_RE = re.compile(
+    r"^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\Z"
+).match
+
+# Limit on concurrent rmtree calls during a cleanup sweep
+_RMTREE_SEM = asyncio.Semaphore(8)
+
+# Strong references to running workers so they are not garbage collected
+_BG_TASKS: Set[asyncio.Task] = set()
+
 # Global reference to tasks for cleanup
-TASKS_REF: Dict[str, Dict[str, Any]] = {}
+TASKS_REF: Dict[str, Task] = {}
 
 
 def set_tasks_reference(tasks_dict):
@@ -19,74 +35,119 @@ def set_tasks_reference(tasks_dict):
 
 async def cleanup_worker():
     """Background worker to clean up old files and completed tasks"""
+    # Sweep /tmp once on startup to catch directories left by a previous run
+    try:
+        await cleanup_old_files()
+    except Exception as e:
+        logger.error(f"Error in startup cleanup: {str(e)}")
+    
     while True:
         try:
-            await cleanup_old_files()
-            await asyncio.sleep(300)  # Run every 5 minutes
+            await cleanup_expired_tasks()
+            
+            # Sleep until the next task is due to expire
+            async with EXPIRIES_LOCK:
+                next_expiry = EXPIRIES[0][0] if EXPIRIES else None
+            if next_expiry is None:
+                # Any task queued from now on expires at least TASK_TTL away
+                await asyncio.sleep(TASK_TTL)
+            else:
+                await asyncio.sleep(max(1, next_expiry - time.time()))
         except Exception as e:
             logger.error(f"Error in cleanup worker: {str(e)}")
             await asyncio.sleep(60)  # Wait 1 minute before retry on error
 
 
-async def cleanup_old_files():
-    """Clean up files older than 1 hour and remove completed tasks older than 24 hours"""
-    tmp_base = pathlib.Path("/tmp")
-    current_time = time.time()
-    cleaned_files = 0
-    cleaned_tasks = 0
-    
-    # Clean up old task directories
-    for task_dir in tmp_base.glob("*"):
-        if not task_dir.is_dir():
-            continue
-            
-        try:
-            # Check if directory name looks like a UUID (task_id)
-            task_id = task_dir.name
-            if len(task_id) != 36 or task_id.count('-') != 4:
-                continue
+def _scan_task_dirs(tmp_base: str) -> List[Tuple[str, str, float]]:
+    """Return (task_id, path, mtime) for every task directory under tmp_base"""
+    found = []
+    with os.scandir(tmp_base) as it:
+        for entry in it:
+            try:
+                if not entry.is_dir(follow_symlinks=False):
+                    continue
                 
-            # Get directory age
-            dir_age = current_time - task_dir.stat().st_mtime
-            
-            # Remove directories older than 1 hour
-            if dir_age > 3600:  # 1 hour
-                logger.info(f"Cleaning up old task directory: {task_id}")
-                shutil.rmtree(task_dir, ignore_errors=True)
-                cleaned_files += 1
+                # Check if directory name looks like a UUID (task_id)
+                if not _UUID_RE(entry.name):
+                    continue
                 
-                # Also remove from tasks dict if exists
-                if task_id in TASKS_REF:
-                    del TASKS_REF[task_id]
-                    cleaned_tasks += 1
-                    
+                found.append((entry.name, entry.path, entry.stat(follow_symlinks=False).st_mtime))
+            except OSError as e:
+                logger.warning(f"Failed to stat directory {entry.path}: {str(e)}")
+    return found
+
+
+async def _remove_dir(path: str):
+    """Remove a directory tree in a worker thread, bounded by _RMTREE_SEM"""
+    async with _RMTREE_SEM:
+        try:
+            await asyncio.to_thread(shutil.rmtree, path, ignore_errors=True)
         except Exception as e:
-            logger.warning(f"Failed to clean up directory {task_dir}: {str(e)}")
+            logger.warning(f"Failed to clean up directory {path}: {str(e)}")
+
+
+async def cleanup_old_files():
+    """Sweep task directories left in /tmp by a previous run
+
+    Directories older than TASK_TTL are removed now; younger ones are
+    scheduled on EXPIRIES so the expiry loop removes them once they age out.
+    """
+    current_time = time.time()
+    
+    # Enumerate and stat all task directories in a single thread hop
+    task_dirs = await asyncio.to_thread(_scan_task_dirs, TMP_ROOT)
+    
+    # Collect stale directories, then remove them concurrently
+    stale = [
+        (task_id, task_path) for task_id, task_path, mtime in task_dirs
+        if current_time - mtime > TASK_TTL
+    ]
+    for task_id, _ in stale:
+        logger.info(f"Cleaning up old task directory: {task_id}")
+    await asyncio.gather(*(_remove_dir(task_path) for _, task_path in stale))
     
-    # Clean up old completed tasks from memory (older than 24 hours)
-    tasks_to_remove = []
-    for task_id, task_data in TASKS_REF.items():
-        if task_data.get("state") in ["ready", "error"]:
-            # Check if task directory still exists to determine age
-            task_dir = tmp_base / task_id
-            if not task_dir.exists():
-                # Directory was cleaned up, remove from memory too
-                tasks_to_remove.append(task_id)
+    # Schedule the remaining leftovers for removal when they reach TASK_TTL
+    scheduled = 0
+    async with EXPIRIES_LOCK:
+        for task_id, _, mtime in task_dirs:
+            if current_time - mtime <= TASK_TTL:
+                heapq.heappush(EXPIRIES, (mtime + TASK_TTL, task_id))
+                scheduled += 1
     
-    for task_id in tasks_to_remove:
-        del TASKS_REF[task_id]
-        cleaned_tasks += 1
+    if stale or scheduled:
+        logger.info(f"Startup cleanup: {len(stale)} directories removed, {scheduled} scheduled for expiry")
+
+
+async def cleanup_expired_tasks():
+    """Remove the files and registry entries of tasks past their scheduled expiry"""
+    current_time = time.time()
+    
+    expired = []
+    async with EXPIRIES_LOCK:
+        while EXPIRIES and EXPIRIES[0][0] <= current_time:
+            _, task_id = heapq.heappop(EXPIRIES)
+            expired.append(task_id)
+    
+    if not expired:
+        return
+    
+    await asyncio.gather(*(_remove_dir(f"{TMP_ROOT}/{task_id}") for task_id in expired))
+    
+    cleaned_tasks = 0
+    async with TASKS_LOCK:
+        for task_id in expired:
+            if TASKS_REF.pop(task_id, None) is not None:
+                cleaned_tasks += 1
     
-    if cleaned_files > 0 or cleaned_tasks > 0:
-        logger.info(f"Cleanup completed: {cleaned_files} directories, {cleaned_tasks} tasks removed")
+    logger.info(f"Expiry cleanup completed: {len(expired)} directories, {cleaned_tasks} tasks removed")
 
 
-def cleanup_task_files(task_id: str):
+async def cleanup_task_files(task_id: str):
     """Clean up files for a specific task immediately"""
     try:
-        task_dir = pathlib.Path("/tmp") / task_id
-        if task_dir.exists():
-            shutil.rmtree(task_dir, ignore_errors=True)
+        task_dir = f"{TMP_ROOT}/{task_id}"
+        if await asyncio.to_thread(os.path.exists, task_dir):
+            await asyncio.to_thread(shutil.rmtree, task_dir, ignore_errors=True)
             logger.info(f"Cleaned up files for task: {task_id}")
     except Exception as e:
         logger.warning(f"Failed to clean up task {task_id}: {str(e)}")
@@ -94,4 +155,6 @@ def cleanup_task_files(task_id: str):
 
 def start_cleanup_worker():
     """Start the cleanup worker as a background task"""
-    asyncio.create_task(cleanup_worker())
\ No newline at end of file
+    task = asyncio.create_task(cleanup_worker())
+    _BG_TASKS.add(task)
+    task.add_done_callback(_BG_TASKS.discard)
\ No newline at end of file
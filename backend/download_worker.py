@@ -1,68 +1,111 @@
 import asyncio
-import subprocess
-import pathlib
+import heapq
 import logging
-from typing import Dict, Any
+import os
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+from yt_dlp import YoutubeDL
+from yt_dlp.utils import DownloadError
+
+from .models import Task
 
 logger = logging.getLogger(__name__)
 
-QUEUE: asyncio.Queue = asyncio.Queue()
-TASKS: Dict[str, Dict[str, Any]] = {}
+# Base directory for per-task files, kept as a plain string since it is
+# only ever joined with a task id and handed to os/shutil/FFmpeg
+TMP_ROOT = "/tmp"
+
+# Bounded so bursts of /download requests get a 503 instead of piling up;
+# roughly 4x the default number of download workers
+QUEUE: asyncio.Queue = asyncio.Queue(maxsize=16)
+TASKS: Dict[str, Task] = {}
+# Held while inserting into or deleting from TASKS
+TASKS_LOCK = asyncio.Lock()
+
+# Strong references to running workers so they are not garbage collected
+_BG_TASKS: Set[asyncio.Task] = set()
+
+# Seconds a task and its files are kept before cleanup removes them
+TASK_TTL = 3600
+
+# Min-heap of (expiry_time, task_id), consumed by the cleanup worker
+EXPIRIES: List[Tuple[float, str]] = []
+EXPIRIES_LOCK = asyncio.Lock()
+
+
+async def schedule_expiry(task_id: str):
+    """Schedule a task for removal TASK_TTL seconds from now"""
+    async with EXPIRIES_LOCK:
+        heapq.heappush(EXPIRIES, (time.time() + TASK_TTL, task_id))
+
+
+def _set_state(task: Task, state: str, error_message: Optional[str] = None):
+    """Update a task's state and wake anyone waiting for the change"""
+    task.state = state
+    if error_message is not None:
+        task.error_message = error_message
+    event, task.event = task.event, asyncio.Event()
+    event.set()
+
+
+def _download_audio(url: str, tmp_dir: str):
+    """Download the audio track of url to tmp_dir/audio.m4a with yt-dlp"""
+    opts = {
+        "format": "bestaudio/best",
+        "outtmpl": f"{tmp_dir}/audio.%(ext)s",
+        "postprocessors": [{
+            "key": "FFmpegExtractAudio",  # Extract audio only
+            "preferredcodec": "m4a",
+            "preferredquality": "0",  # Best quality
+        }],
+        "quiet": True,
+        "noprogress": True,
+    }
+    with YoutubeDL(opts) as ydl:
+        ydl.download([url])
 
 
 async def download_worker():
-    """Worker process to handle download tasks sequentially"""
+    """Worker process to handle download tasks from the shared queue"""
     while True:
+        task_id = await QUEUE.get()
         try:
-            task_id = await QUEUE.get()
             task = TASKS.get(task_id)
             
             if not task:
                 logger.error(f"Task {task_id} not found in TASKS")
                 continue
                 
-            task["state"] = "downloading"
-            url = task["url"]
-            tmp_dir = pathlib.Path("/tmp") / task_id
-            tmp_dir.mkdir(exist_ok=True)
-            
-            # Download audio using yt-dlp
-            cmd = [
-                "yt-dlp",
-                "-x",  # Extract audio only
-                "--audio-format", "m4a",
-                "--audio-quality", "0",  # Best quality
-                "-o", str(tmp_dir / "audio.%(ext)s"),
-                url
-            ]
+            _set_state(task, "downloading")
+            url = task.url
+            tmp_dir = f"{TMP_ROOT}/{task_id}"
+            os.makedirs(tmp_dir, exist_ok=True)
             
             logger.info(f"Starting download for task {task_id}: {url}")
             
-            proc = await asyncio.create_subprocess_exec(
-                *cmd,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
-            
-            stdout, stderr = await proc.communicate()
-            
-            if proc.returncode == 0:
-                task["state"] = "ready"
-                logger.info(f"Download completed for task {task_id}")
+            try:
+                await asyncio.to_thread(_download_audio, url, tmp_dir)
+            except DownloadError as e:
+                _set_state(task, "error", str(e) or "Download failed")
+                logger.error(f"Download failed for task {task_id}: {task.error_message}")
             else:
-                task["state"] = "error"
-                task["error_message"] = stderr.decode() if stderr else "Download failed"
-                logger.error(f"Download failed for task {task_id}: {task['error_message']}")
+                # Stat once so /audio can serve the file without re-statting
+                task.audio_stat = os.stat(f"{tmp_dir}/audio.m4a")
+                _set_state(task, "ready")
+                logger.info(f"Download completed for task {task_id}")
                 
         except Exception as e:
             logger.error(f"Error in download worker: {str(e)}")
-            if task_id and task_id in TASKS:
-                TASKS[task_id]["state"] = "error"
-                TASKS[task_id]["error_message"] = str(e)
+            if task_id in TASKS:
+                _set_state(TASKS[task_id], "error", str(e))
         finally:
             QUEUE.task_done()
 
 
-def start_download_worker():
-    """Start the download worker as a background task"""
-    asyncio.create_task(download_worker())
\ No newline at end of file
+def start_download_worker(num_workers: int = 4):
+    """Start num_workers download workers as background tasks"""
+    for _ in range(num_workers):
+        task = asyncio.create_task(download_worker())
+        _BG_TASKS.add(task)
+        task.add_done_callback(_BG_TASKS.discard)
\ No newline at end of file
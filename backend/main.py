@@ -1,17 +1,26 @@
 import asyncio
+import hashlib
+import os
+import re
 import uuid
 import logging
 from contextlib import asynccontextmanager
+from email.utils import formatdate
 from pathlib import Path
-from fastapi import FastAPI, HTTPException
+from typing import Optional, Tuple
+
+import aiofiles
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, ORJSONResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 
-from .models import DownloadRequest, DownloadResponse, TaskStatus, ProcessRequest
-from .download_worker import QUEUE, TASKS, start_download_worker
+from .models import DownloadRequest, DownloadResponse, TaskStatus, ProcessRequest, Task
+from .download_worker import QUEUE, TASKS, TASKS_LOCK, TMP_ROOT, schedule_expiry, start_download_worker
+from .download_worker import _BG_TASKS as DOWNLOAD_TASKS
 from .process_handler import process_audio
 from .cleanup import start_cleanup_worker, set_tasks_reference, cleanup_old_files
+from .cleanup import _BG_TASKS as CLEANUP_TASKS
 
 # Configure logging
 logging.basicConfig(
@@ -20,6 +29,58 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Single byte range, e.g. "bytes=0-1023", "bytes=1024-" or "bytes=-500"
+_RANGE_RE = re.compile(r"bytes=(\d*)-(\d*)\Z")
+
+
+def _parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Return the inclusive (start, end) of a single byte range, or None to send the whole file"""
+    match = _RANGE_RE.match(header.strip())
+    if not match or match.group(1) == match.group(2) == "":
+        # Multiple or malformed ranges: fall back to a full response
+        return None
+    
+    first, last = match.groups()
+    if first and last and int(last) < int(first):
+        # Invalid range (last byte before first): ignore it
+        return None
+    
+    if first == "":
+        # Suffix range: the last N bytes
+        start, end = max(0, size - int(last)), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    
+    if start >= size:
+        raise HTTPException(
+            status_code=416,
+            detail="Requested range not satisfiable",
+            headers={"Content-Range": f"bytes */{size}"}
+        )
+    return start, end
+
+
+def _stat_validators(stat_result: os.stat_result) -> Tuple[str, str]:
+    """Return the (Last-Modified, ETag) values FileResponse derives from a stat result"""
+    last_modified = formatdate(stat_result.st_mtime, usegmt=True)
+    etag_base = f"{stat_result.st_mtime}-{stat_result.st_size}"
+    etag = f'"{hashlib.md5(etag_base.encode(), usedforsecurity=False).hexdigest()}"'
+    return last_modified, etag
+
+
+async def _iter_file_range(path: str, start: int, end: int, chunk_size: int = 64 * 1024):
+    """Yield the bytes of path from start to end inclusive"""
+    async with aiofiles.open(path, "rb") as f:
+        await f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = await f.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -33,9 +94,17 @@ async def lifespan(app: FastAPI):
     set_tasks_reference(TASKS)
     start_cleanup_worker()
     
+    # Read index.html once so the SPA fallback never touches the disk
+    index_path = static_folder / "index.html"
+    app.state.index_bytes = index_path.read_bytes() if index_path.exists() else None
+    
     yield
     # Cleanup on shutdown
     logger.info("Shutting down...")
+    workers = [*DOWNLOAD_TASKS, *CLEANUP_TASKS]
+    for worker in workers:
+        worker.cancel()
+    await asyncio.gather(*workers, return_exceptions=True)
 
 
 # Create FastAPI app
@@ -43,6 +112,7 @@ app = FastAPI(
     title="Holo-Sounds Audio Editor",
     description="Download and edit audio clips",
     version="0.2.0",
+    default_response_class=ORJSONResponse,
     lifespan=lifespan
 )
 
@@ -66,20 +136,24 @@ async def download_audio(request: DownloadRequest):
         task_id = str(uuid.uuid4())
         
         # Create task entry
-        TASKS[task_id] = {
-            "task_id": task_id,
-            "url": str(request.url),
-            "state": "queued",
-            "error_message": None
-        }
+        async with TASKS_LOCK:
+            TASKS[task_id] = Task(task_id=task_id, url=str(request.url))
+            
+            # Add to download queue, rejecting the request if it is full
+            try:
+                QUEUE.put_nowait(task_id)
+            except asyncio.QueueFull:
+                del TASKS[task_id]
+                raise HTTPException(status_code=503, detail="Server busy, retry later")
         
-        # Add to download queue
-        await QUEUE.put(task_id)
+        await schedule_expiry(task_id)
         
         logger.info(f"Created download task {task_id} for URL: {request.url}")
         
         return DownloadResponse(task_id=task_id)
     
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error creating download task: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to start download: {str(e)}")
@@ -94,8 +168,39 @@ async def get_task_status(task_id: str):
         raise HTTPException(status_code=404, detail="Task not found")
     
     return TaskStatus(
-        state=task["state"],
-        error_message=task.get("error_message")
+        state=task.state,
+        error_message=task.error_message
+    )
+
+
+@app.get("/api/status/{task_id}/stream")
+async def stream_task_status(task_id: str):
+    """Push status changes of a download task as server-sent events"""
+    task = TASKS.get(task_id)
+    
+    if not task:
+        raise HTTPException(status_code=404, detail="Task not found")
+    
+    async def events():
+        last_state = None
+        while True:
+            # Grab the event before reading state so no change is missed
+            event = task.event
+            if task.state != last_state:
+                last_state = task.state
+                status = TaskStatus(state=task.state, error_message=task.error_message)
+                yield f"data: {status.model_dump_json()}\n\n"
+            if last_state in ("ready", "error"):
+                return
+            try:
+                await asyncio.wait_for(event.wait(), timeout=15)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"}
     )
 
 
@@ -106,23 +211,51 @@ async def process_audio_endpoint(request: ProcessRequest):
 
 
 @app.get("/api/audio/{task_id}")
-async def get_audio_file(task_id: str):
+async def get_audio_file(task_id: str, request: Request):
     """Get the downloaded audio file for waveform display"""
     task = TASKS.get(task_id)
     
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
     
-    if task["state"] != "ready":
-        raise HTTPException(status_code=400, detail=f"Task is not ready. Current state: {task['state']}")
+    if task.state != "ready":
+        raise HTTPException(status_code=400, detail=f"Task is not ready. Current state: {task.state}")
+    
+    audio_path = f"{TMP_ROOT}/{task_id}/audio.m4a"
+    audio_stat = task.audio_stat or os.stat(audio_path)
+    headers = {
+        "Accept-Ranges": "bytes",
+        # The downloaded file never changes once the task is ready
+        "Cache-Control": "public, max-age=3600",
+    }
     
-    audio_path = f"/tmp/{task_id}/audio.m4a"
+    # Serve partial content so the waveform can start from the first bytes,
+    # unless an If-Range validator shows the client's copy is out of date
+    range_header = request.headers.get("range")
+    last_modified, etag = _stat_validators(audio_stat)
+    if_range = request.headers.get("if-range")
+    if if_range is not None and if_range not in (etag, last_modified):
+        range_header = None
+    byte_range = _parse_range(range_header, audio_stat.st_size) if range_header else None
+    if byte_range:
+        start, end = byte_range
+        headers["Last-Modified"] = last_modified
+        headers["ETag"] = etag
+        headers["Content-Range"] = f"bytes {start}-{end}/{audio_stat.st_size}"
+        headers["Content-Length"] = str(end - start + 1)
+        return StreamingResponse(
+            _iter_file_range(audio_path, start, end),
+            status_code=206,
+            media_type="audio/mp4",
+            headers=headers
+        )
     
     return FileResponse(
         path=audio_path,
         media_type="audio/mp4",
         filename=f"audio_{task_id}.m4a",
-        headers={"Cache-Control": "no-cache, no-store, must-revalidate"}
+        stat_result=audio_stat,
+        headers=headers
     )
 
 # --- Static file serving ---
@@ -133,14 +266,16 @@ static_folder = Path(__file__).parent.parent / "frontend" / "dist"
 app.mount("/assets", StaticFiles(directory=static_folder / "assets"), name="assets")
 
 @app.get("/{full_path:path}")
-async def serve_react_app(full_path: str):
+async def serve_react_app(full_path: str, request: Request):
     """Serve the React application"""
-    index_path = static_folder / "index.html"
-    if not index_path.exists():
+    index_bytes = request.app.state.index_bytes
+    if index_bytes is None:
         raise HTTPException(status_code=404, detail="Frontend not built. Run `npm run build` in the frontend directory.")
-    return FileResponse(index_path)
+    return Response(index_bytes, media_type="text/html", headers={"Cache-Control": "no-cache"})
 
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8080)
\ No newline at end of file
+    # uvloop is not available on Windows (see requirements.txt); use the
+    # uvicorn CLI there instead of running this module directly
+    uvicorn.run(app, host="0.0.0.0", port=8080, loop="uvloop", http="httptools", workers=1)
\ No newline at end of file
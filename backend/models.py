@@ -1,3 +1,6 @@
+import asyncio
+import os
+from dataclasses import dataclass, field
 from pydantic import BaseModel, HttpUrl
 from typing import Optional, Literal
 
@@ -15,6 +18,18 @@ class TaskStatus(BaseModel):
     error_message: Optional[str] = None
 
 
+@dataclass(slots=True)
+class Task:
+    """In-memory record of a download task"""
+    task_id: str
+    url: str
+    state: Literal["queued", "downloading", "ready", "error"] = "queued"
+    error_message: Optional[str] = None
+    audio_stat: Optional[os.stat_result] = None
+    # Set and replaced on every state change to wake /status stream listeners
+    event: asyncio.Event = field(default_factory=asyncio.Event)
+
+
 class ProcessRequest(BaseModel):
     task_id: str
     start: float
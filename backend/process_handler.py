@@ -1,14 +1,29 @@
-import subprocess
+import asyncio
+import hashlib
 import uuid
-import pathlib
+import os
 import logging
 from fastapi import HTTPException
 from fastapi.responses import FileResponse
 from .models import ProcessRequest
-from .download_worker import TASKS
+from .download_worker import TASKS, TMP_ROOT
 
 logger = logging.getLogger(__name__)
 
+# FFmpeg filter chains keyed by (denoise, fade_in, fade_out), applied in the
+# order trim -> denoise -> fade in -> fade out and filled in with str.format
+_FILTER_TEMPLATES = {
+    (denoise, fade_in, fade_out): ",".join(
+        ["atrim=start={start}:end={end},asetpts=PTS-STARTPTS"]
+        + (["afftdn=nr=20:nf=-25"] if denoise else [])  # Noise reduction settings
+        + (["afade=t=in:st=0:d={fade_in}"] if fade_in else [])
+        + (["afade=t=out:st={fade_start}:d={fade_out}"] if fade_out else [])
+    )
+    for denoise in (False, True)
+    for fade_in in (False, True)
+    for fade_out in (False, True)
+}
+
 
 async def process_audio(req: ProcessRequest) -> FileResponse:
     """Process audio file with FFmpeg filters"""
@@ -18,77 +33,105 @@ async def process_audio(req: ProcessRequest) -> FileResponse:
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
     
-    if task["state"] != "ready":
-        raise HTTPException(status_code=400, detail=f"Task is not ready. Current state: {task['state']}")
+    if task.state != "ready":
+        raise HTTPException(status_code=400, detail=f"Task is not ready. Current state: {task.state}")
     
-    tmp_dir = pathlib.Path("/tmp") / req.task_id
-    src = tmp_dir / "audio.m4a"
+    tmp_dir = f"{TMP_ROOT}/{req.task_id}"
+    src = f"{tmp_dir}/audio.m4a"
     
-    if not src.exists():
+    if not os.path.exists(src):
         raise HTTPException(status_code=404, detail="Source audio file not found")
     
-    # Generate output filename
-    output_id = str(uuid.uuid4())
-    out = tmp_dir / f"{output_id}.ogg"
-    
-    # Build FFmpeg filter chain
-    filters = []
-    
-    # Trim audio
-    duration = req.end - req.start
-    filters.append(f"atrim=start={req.start}:end={req.end},asetpts=PTS-STARTPTS")
-    
-    # Apply denoising if requested
-    if req.denoise:
-        filters.append("afftdn=nr=20:nf=-25")  # Noise reduction settings
-    
-    # Apply fade in
-    if req.fade_in > 0:
-        filters.append(f"afade=t=in:st=0:d={req.fade_in}")
+    # Name the output after the request parameters so repeats hit the cache
+    key = hashlib.blake2b(
+        f"{req.task_id}|{req.start}|{req.end}|{req.fade_in}|{req.fade_out}|{int(req.denoise)}".encode(),
+        digest_size=16
+    ).hexdigest()
+    filename = f"clip_{key}.ogg"
+    out = f"{tmp_dir}/{filename}"
     
-    # Apply fade out
-    if req.fade_out > 0 and req.fade_out < duration:
-        fade_start = duration - req.fade_out
-        filters.append(f"afade=t=out:st={fade_start}:d={req.fade_out}")
-    
-    # Combine all filters
-    filter_string = ",".join(filters)
+    if os.path.exists(out):
+        logger.info(f"Serving cached clip for task {req.task_id}: {key}")
+        return FileResponse(
+            path=out,
+            media_type="audio/ogg",
+            filename=filename
+        )
     
-    # Build FFmpeg command
-    ffmpeg_cmd = [
-        "ffmpeg",
-        "-y",  # Overwrite output file
-        "-i", str(src),
-        "-af", filter_string,
-        "-c:a", "libvorbis",  # Ogg Vorbis codec
-        "-q:a", "6",  # Quality setting (0-10, higher is better)
-        str(out)
-    ]
+    # Encode to a unique partial file so concurrent identical requests never
+    # serve a half-written clip; it is renamed into place once complete
+    partial = f"{tmp_dir}/.clip_{key}.{uuid.uuid4().hex}.ogg"
     
-    logger.info(f"Processing audio for task {req.task_id} with filters: {filter_string}")
+    duration = req.end - req.start
+    has_fade_out = req.fade_out > 0 and req.fade_out < duration
     
-    try:
-        # Run FFmpeg
-        result = subprocess.run(
-            ffmpeg_cmd,
-            capture_output=True,
-            text=True,
-            check=True
+    if not req.denoise and req.fade_in <= 0 and not has_fade_out:
+        # Pure trim: seek on the input side so FFmpeg skips straight to the
+        # start point instead of decoding everything before it through atrim
+        ffmpeg_cmd = [
+            "ffmpeg",
+            "-y",  # Overwrite output file
+            "-ss", str(req.start),
+            "-to", str(req.end),
+            "-i", src,
+            "-vn",
+            "-c:a", "libvorbis",  # Ogg Vorbis codec
+            "-q:a", "6",  # Quality setting (0-10, higher is better)
+            partial
+        ]
+        
+        logger.info(f"Trimming audio for task {req.task_id}: {req.start}-{req.end}")
+    else:
+        # Build FFmpeg filter chain from the precomputed template
+        filter_string = _FILTER_TEMPLATES[req.denoise, req.fade_in > 0, has_fade_out].format(
+            start=req.start,
+            end=req.end,
+            fade_in=req.fade_in,
+            fade_start=duration - req.fade_out,
+            fade_out=req.fade_out
         )
         
-        if not out.exists():
-            raise HTTPException(status_code=500, detail="Failed to generate output file")
+        # Build FFmpeg command
+        ffmpeg_cmd = [
+            "ffmpeg",
+            "-y",  # Overwrite output file
+            "-i", src,
+            "-af", filter_string,
+            "-c:a", "libvorbis",  # Ogg Vorbis codec
+            "-q:a", "6",  # Quality setting (0-10, higher is better)
+            partial
+        ]
         
-        # Return the processed file
-        return FileResponse(
-            path=str(out),
-            media_type="audio/ogg",
-            filename=f"clip_{output_id}.ogg"
+        logger.info(f"Processing audio for task {req.task_id} with filters: {filter_string}")
+    
+    try:
+        # Run FFmpeg without blocking the event loop
+        proc = await asyncio.create_subprocess_exec(
+            *ffmpeg_cmd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
         )
-        
-    except subprocess.CalledProcessError as e:
-        logger.error(f"FFmpeg error: {e.stderr}")
-        raise HTTPException(status_code=500, detail=f"Audio processing failed: {e.stderr}")
+        _, stderr = await proc.communicate()
     except Exception as e:
         logger.error(f"Unexpected error: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
+    
+    if proc.returncode != 0:
+        try:
+            os.unlink(partial)
+        except FileNotFoundError:
+            pass
+        error = stderr.decode(errors="replace")
+        logger.error(f"FFmpeg error: {error}")
+        raise HTTPException(status_code=500, detail=f"Audio processing failed: {error}")
+    
+    if not os.path.exists(partial):
+        raise HTTPException(status_code=500, detail="Failed to generate output file")
+    os.replace(partial, out)
+    
+    # Return the processed file
+    return FileResponse(
+        path=out,
+        media_type="audio/ogg",
+        filename=filename
+    )
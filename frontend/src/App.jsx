@@ -1,7 +1,7 @@
 import { useState } from 'react';
 import './App.css';
 import WaveformEditor from './components/WaveformEditor';
-import { downloadAudio, getTaskStatus, processAudio, getAudioUrl } from './api';
+import { downloadAudio, getStatusStreamUrl, processAudio, getAudioUrl } from './api';
 
 function App() {
   const [url, setUrl] = useState('');
@@ -26,26 +26,28 @@ function App() {
       const { task_id } = await downloadAudio(url);
       setTaskId(task_id);
 
-      // Poll for status
-      const pollInterval = setInterval(async () => {
-        try {
-          const status = await getTaskStatus(task_id);
-          
-          if (status.state === 'ready') {
-            clearInterval(pollInterval);
-            setStatus('ready');
-            setAudioUrl(getAudioUrl(task_id));
-          } else if (status.state === 'error') {
-            clearInterval(pollInterval);
-            setStatus('error');
-            setError(status.error_message || 'Download failed');
-          }
-        } catch (err) {
-          clearInterval(pollInterval);
+      // Listen for status changes pushed by the server
+      const events = new EventSource(getStatusStreamUrl(task_id));
+
+      events.onmessage = (e) => {
+        const status = JSON.parse(e.data);
+
+        if (status.state === 'ready') {
+          events.close();
+          setStatus('ready');
+          setAudioUrl(getAudioUrl(task_id));
+        } else if (status.state === 'error') {
+          events.close();
           setStatus('error');
-          setError('Failed to check status');
+          setError(status.error_message || 'Download failed');
         }
-      }, 2000);
+      };
+
+      events.onerror = () => {
+        events.close();
+        setStatus('error');
+        setError('Failed to check status');
+      };
 
     } catch (err) {
       setStatus('error');
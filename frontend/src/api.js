@@ -19,6 +19,10 @@ export const getTaskStatus = async (taskId) => {
   return response.data;
 };
 
+export const getStatusStreamUrl = (taskId) => {
+  return `${API_BASE_URL}/status/${taskId}/stream`;
+};
+
 export const processAudio = async (params) => {
   const response = await api.post('/process', params, {
     responseType: 'blob',